@@ -3,42 +3,59 @@ Note Taker AI - Transcription API
 Flask backend for recording, transcribing, and summarizing audio notes
 """
 
+import hashlib
+import logging
 import os
 import uuid
 from datetime import datetime
+import orjson
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
 
+import storage
+import tasks
 from services.assemblyai_service import AssemblyAIService
-from services.openai_service import OpenAIService
+
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+logger = logging.getLogger(__name__)
+
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson; notes responses can carry tens of KB
+    of transcription text and orjson serializes several times faster than
+    the stdlib encoder"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'webm', 'mp3', 'wav', 'm4a', 'ogg'}
+ALLOWED_EXTENSIONS = frozenset({'webm', 'mp3', 'wav', 'm4a', 'ogg'})
 MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-# Ensure upload folder exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Run transcription/summarization on the Celery worker pool when a broker
+# is configured; otherwise fall back to running them inline
+USE_TASK_QUEUE = bool(os.getenv('REDIS_URL'))
 
 # Initialize services
 assemblyai_service = AssemblyAIService()
-openai_service = OpenAIService()
-
-# In-memory storage (for demo purposes)
-transcriptions = {}
-summaries = {}
 
 
 def allowed_file(filename):
     """Check if the file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    # rpartition avoids the list allocation rsplit would make on every upload
+    _, dot, ext = filename.rpartition('.')
+    return bool(dot) and ext.lower() in ALLOWED_EXTENSIONS
 
 
 @app.route('/health', methods=['GET'])
@@ -51,18 +68,31 @@ def health():
 def transcribe():
     """
     Upload audio file for transcription
-    Accepts: multipart/form-data with 'audio' file
+    Accepts: raw audio bytes (any non-multipart Content-Type) with the original
+    filename in an X-Filename header, or legacy multipart/form-data with an
+    'audio' file; both stream straight to AssemblyAI without touching disk
     Returns: { id, status, text? }
     """
-    if 'audio' not in request.files:
-        return jsonify({'error': 'No audio file provided'}), 400
+    is_multipart = 'multipart/form-data' in (request.content_type or '')
 
-    file = request.files['audio']
-    
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+    if is_multipart:
+        # Legacy path: Werkzeug parses the multipart body before we run
+        if 'audio' not in request.files:
+            return jsonify({'error': 'No audio file provided'}), 400
 
-    if not allowed_file(file.filename):
+        file = request.files['audio']
+
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        upload_filename = file.filename
+    else:
+        file = None
+        upload_filename = request.headers.get('X-Filename', '')
+
+        if upload_filename == '':
+            return jsonify({'error': 'No filename provided (set X-Filename header)'}), 400
+
+    if not allowed_file(upload_filename):
         return jsonify({
             'error': f'File type not allowed. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
         }), 400
@@ -70,34 +100,61 @@ def transcribe():
     try:
         # Generate unique ID
         transcription_id = str(uuid.uuid4())
-        
-        # Save file
-        filename = secure_filename(f"{transcription_id}_{file.filename}")
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
-        # Start transcription
-        result = assemblyai_service.transcribe_audio(filepath)
-        
-        # Store in memory
-        transcriptions[transcription_id] = {
+
+        # Pipe the audio straight to AssemblyAI's upload endpoint, hashing
+        # in flight. Neither path touches local disk, so the enqueued task
+        # works from any worker host, not just the web container
+        stream = file.stream if file is not None else request.stream
+        hasher = hashlib.sha256()
+
+        def hashed_chunks():
+            while chunk := stream.read(5 << 20):
+                hasher.update(chunk)
+                yield chunk
+
+        audio_source = assemblyai_service.upload_stream(hashed_chunks())
+        audio_digest = hasher.hexdigest()
+
+        # Identical audio already transcribed? Serve the cached result and
+        # skip the transcription round trip entirely
+        cached_id = storage.get_cached_transcription_id(audio_digest)
+        cached = storage.get_transcription(cached_id) if cached_id else None
+        if cached and cached['status'] != 'error':
+            return jsonify({
+                'id': cached['id'],
+                'status': cached['status'],
+                'text': cached.get('text'),
+                'error': cached.get('error')
+            }), 200
+
+        # Create the record, then hand the slow work to a worker
+        storage.save_transcription({
             'id': transcription_id,
-            'status': result['status'],
-            'text': result.get('text'),
-            'error': result.get('error'),
-            'filepath': filepath,
+            'status': 'queued',
+            'text': None,
+            'error': None,
+            'transcript_id': None,
             'created_at': datetime.utcnow().isoformat()
-        }
+        })
+        storage.cache_audio_digest(audio_digest, transcription_id)
+
+        if USE_TASK_QUEUE:
+            tasks.transcribe_task.delay(transcription_id, audio_source)
+            return jsonify({'id': transcription_id, 'status': 'queued'}), 202
+
+        # No broker configured: run inline (original synchronous behavior)
+        tasks.transcribe_task(transcription_id, audio_source)
+        transcription = storage.get_transcription(transcription_id)
 
         return jsonify({
             'id': transcription_id,
-            'status': result['status'],
-            'text': result.get('text'),
-            'error': result.get('error')
+            'status': transcription['status'],
+            'text': transcription.get('text'),
+            'error': transcription.get('error')
         }), 200
 
     except Exception as e:
-        print(f"Transcription error: {str(e)}")
+        logger.exception("Transcription error")
         return jsonify({'error': str(e)}), 500
 
 
@@ -107,11 +164,21 @@ def get_transcription(transcription_id):
     Get transcription status and result
     Returns: { id, status, text? }
     """
-    if transcription_id not in transcriptions:
+    transcription = storage.get_transcription(transcription_id)
+    if transcription is None:
         return jsonify({'error': 'Transcription not found'}), 404
 
-    transcription = transcriptions[transcription_id]
-    
+    # Still processing: refresh from AssemblyAI in case the webhook was
+    # missed. 'unknown' means the status fetch itself failed; keep the
+    # record as processing and let the next poll retry
+    if transcription['status'] == 'processing' and transcription.get('transcript_id'):
+        result = assemblyai_service.get_transcript(transcription['transcript_id'])
+        if result['status'] != 'unknown':
+            transcription['status'] = result['status']
+            transcription['text'] = result.get('text')
+            transcription['error'] = result.get('error')
+            storage.save_transcription(transcription)
+
     return jsonify({
         'id': transcription['id'],
         'status': transcription['status'],
@@ -120,17 +187,47 @@ def get_transcription(transcription_id):
     }), 200
 
 
+@app.route('/api/assemblyai/webhook', methods=['POST'])
+def assemblyai_webhook():
+    """
+    Completion callback from AssemblyAI (configured via WEBHOOK_URL)
+    Receives: { transcript_id, status }
+    """
+    payload = request.get_json(silent=True) or {}
+    transcript_id = payload.get('transcript_id')
+
+    transcription_id = storage.get_transcription_id(transcript_id) if transcript_id else None
+    if transcription_id is None:
+        return jsonify({'error': 'Unknown transcript_id'}), 404
+
+    transcription = storage.get_transcription(transcription_id)
+    if transcription is None:
+        return jsonify({'error': 'Transcription not found'}), 404
+
+    result = assemblyai_service.get_transcript(transcript_id)
+    if result['status'] == 'unknown':
+        # The status fetch failed; answer non-2xx so AssemblyAI retries
+        # the webhook instead of us persisting a bogus error
+        return jsonify({'error': result.get('error')}), 502
+
+    transcription['status'] = result['status']
+    transcription['text'] = result.get('text')
+    transcription['error'] = result.get('error')
+    storage.save_transcription(transcription)
+
+    return jsonify({'status': 'ok'}), 200
+
+
 @app.route('/api/summarize/<transcription_id>', methods=['POST'])
 def summarize(transcription_id):
     """
     Generate summary from transcription
     Returns: { summary }
     """
-    if transcription_id not in transcriptions:
+    transcription = storage.get_transcription(transcription_id)
+    if transcription is None:
         return jsonify({'error': 'Transcription not found'}), 404
 
-    transcription = transcriptions[transcription_id]
-    
     if transcription['status'] != 'completed':
         return jsonify({'error': 'Transcription not yet completed'}), 400
 
@@ -138,20 +235,18 @@ def summarize(transcription_id):
         return jsonify({'error': 'No transcription text available'}), 400
 
     try:
-        # Generate summary
-        summary = openai_service.summarize_transcription(transcription['text'])
-        
-        # Store summary
-        summaries[transcription_id] = {
-            'transcription_id': transcription_id,
-            'summary': summary,
-            'created_at': datetime.utcnow().isoformat()
-        }
+        if USE_TASK_QUEUE:
+            tasks.summarize_task.delay(transcription_id)
+            return jsonify({'id': transcription_id, 'status': 'queued'}), 202
+
+        # No broker configured: run inline (original synchronous behavior)
+        tasks.summarize_task(transcription_id)
 
-        return jsonify({'summary': summary}), 200
+        summary_data = storage.get_summary(transcription_id) or {}
+        return jsonify({'summary': summary_data.get('summary', '')}), 200
 
     except Exception as e:
-        print(f"Summarization error: {str(e)}")
+        logger.exception("Summarization error")
         return jsonify({'error': str(e)}), 500
 
 
@@ -161,16 +256,18 @@ def get_notes(transcription_id):
     Get complete meeting notes (transcription + summary)
     Returns: { id, transcription, summary, createdAt }
     """
-    if transcription_id not in transcriptions:
+    transcription = storage.get_transcription(transcription_id)
+    if transcription is None:
         return jsonify({'error': 'Transcription not found'}), 404
 
-    transcription = transcriptions[transcription_id]
-    summary_data = summaries.get(transcription_id, {})
+    summary_data = storage.get_summary(transcription_id) or {}
 
     return jsonify({
         'id': transcription_id,
         'transcription': transcription.get('text', ''),
-        'summary': summary_data.get('summary', ''),
+        'summary': summary_data.get('summary') or '',
+        'summaryStatus': summary_data.get('status', ''),
+        'summaryError': summary_data.get('error'),
         'createdAt': transcription['created_at']
     }), 200
 
@@ -178,9 +275,9 @@ def get_notes(transcription_id):
 if __name__ == '__main__':
     # Validate environment variables
     if not os.getenv('ASSEMBLYAI_API_KEY'):
-        print("Warning: ASSEMBLYAI_API_KEY not set")
+        logger.warning("ASSEMBLYAI_API_KEY not set")
     if not os.getenv('OPENAI_API_KEY'):
-        print("Warning: OPENAI_API_KEY not set")
+        logger.warning("OPENAI_API_KEY not set")
     
     app.run(host='0.0.0.0', port=3100, debug=True)
 
@@ -3,66 +3,109 @@ AssemblyAI Service
 Handles audio transcription using AssemblyAI API
 """
 
+import logging
 import os
-import time
 import assemblyai as aai
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
 
 
 class AssemblyAIService:
     """Service for transcribing audio files using AssemblyAI"""
-    
+
+    UPLOAD_ENDPOINT = 'https://api.assemblyai.com/v2/upload'
+
+    # (connect, read) timeouts for raw uploads; without one a stalled
+    # connection hangs the calling thread indefinitely
+    UPLOAD_TIMEOUT = (10, 120)
+
     def __init__(self):
         """Initialize AssemblyAI service with API key"""
         self.api_key = os.getenv('ASSEMBLYAI_API_KEY')
         if not self.api_key:
             raise ValueError("ASSEMBLYAI_API_KEY environment variable not set")
-        
+
         aai.settings.api_key = self.api_key
+        # Public URL AssemblyAI should POST back to when a transcript finishes.
+        # When set, transcribe_audio submits asynchronously instead of blocking.
+        self.webhook_url = os.getenv('WEBHOOK_URL')
         self.transcriber = aai.Transcriber()
-    
-    def transcribe_audio(self, audio_file_path: str, wait_for_completion: bool = True) -> dict:
+        # Pooled session for raw upload requests; avoids a fresh TLS
+        # handshake per upload
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+    def upload_stream(self, audio) -> str:
+        """
+        Stream audio bytes straight to AssemblyAI's upload endpoint without
+        writing them to local disk first
+
+        Args:
+            audio: A file-like object or an iterable of byte chunks
+
+        Returns:
+            str: The upload_url to pass to transcribe_audio
+        """
+        data = iter(lambda: audio.read(5 << 20), b'') if hasattr(audio, 'read') else audio
+        response = self._session.post(
+            self.UPLOAD_ENDPOINT,
+            headers={'authorization': self.api_key},
+            data=data,
+            timeout=self.UPLOAD_TIMEOUT
+        )
+        response.raise_for_status()
+        return response.json()['upload_url']
+
+    def transcribe_audio(self, audio_file_path: str) -> dict:
         """
         Transcribe an audio file
-        
+
+        If WEBHOOK_URL is configured, the file is submitted with a webhook
+        callback and this returns immediately with 'processing'; AssemblyAI
+        notifies us on completion. Otherwise falls back to blocking until
+        the transcription finishes.
+
         Args:
-            audio_file_path: Path to the audio file
-            wait_for_completion: Whether to wait for transcription to complete
-        
+            audio_file_path: Path to the audio file, or a URL (e.g. the
+                upload_url returned by upload_stream)
+
         Returns:
-            dict with keys: status ('completed', 'processing', 'error'), text, error
+            dict with keys: status ('completed', 'processing', 'error'),
+            text, error, transcript_id
         """
         try:
-            # Start transcription
-            transcript = self.transcriber.transcribe(audio_file_path)
-            
-            if wait_for_completion:
-                # Wait for completion
-                while transcript.status not in [
-                    aai.TranscriptStatus.completed,
-                    aai.TranscriptStatus.error
-                ]:
-                    time.sleep(1)
-                    transcript = self.transcriber.get_transcript(transcript.id)
-                
-                if transcript.status == aai.TranscriptStatus.error:
-                    return {
-                        'status': 'error',
-                        'error': transcript.error or 'Transcription failed'
-                    }
-                
+            if self.webhook_url:
+                # Non-blocking submit; completion arrives via webhook
+                config = aai.TranscriptionConfig(webhook_url=self.webhook_url)
+                transcript = self.transcriber.submit(audio_file_path, config=config)
                 return {
-                    'status': 'completed',
-                    'text': transcript.text
+                    'status': 'processing',
+                    'transcript_id': transcript.id
                 }
-            else:
-                # Return immediately with processing status
+
+            # Fallback: no webhook available, wait for completion.
+            # The SDK's transcribe() already polls internally until the
+            # transcript reaches a terminal state, so no manual loop (or
+            # re-fetch of the already-final transcript) is needed here
+            transcript = self.transcriber.transcribe(audio_file_path)
+
+            if transcript.status == aai.TranscriptStatus.error:
                 return {
-                    'status': 'processing',
+                    'status': 'error',
+                    'error': transcript.error or 'Transcription failed',
                     'transcript_id': transcript.id
                 }
-        
+
+            return {
+                'status': 'completed',
+                'text': transcript.text,
+                'transcript_id': transcript.id
+            }
+
         except Exception as e:
-            print(f"AssemblyAI transcription error: {str(e)}")
+            logger.exception("AssemblyAI transcription error")
             return {
                 'status': 'error',
                 'error': str(e)
@@ -74,9 +117,11 @@ class AssemblyAIService:
         
         Args:
             transcript_id: The transcript ID from AssemblyAI
-        
+
         Returns:
-            dict with keys: status, text, error
+            dict with keys: status, text, error. Status 'unknown' means the
+            fetch itself failed (the transcript may still complete), as
+            opposed to 'error', which means the transcription failed
         """
         try:
             transcript = aai.Transcript.get_by_id(transcript_id)
@@ -97,9 +142,11 @@ class AssemblyAIService:
                 }
         
         except Exception as e:
-            print(f"Error getting transcript: {str(e)}")
+            logger.exception("Error getting transcript")
+            # The status fetch failed, not the transcript; callers must not
+            # persist this as a transcription error
             return {
-                'status': 'error',
+                'status': 'unknown',
                 'error': str(e)
             }
 
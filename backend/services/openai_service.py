@@ -3,10 +3,95 @@ OpenAI Service
 Handles summarization using OpenAI GPT API with intelligent chunking
 """
 
+import asyncio
+import functools
+import hashlib
+import logging
 import os
 import re
 from typing import List
-from openai import OpenAI
+
+import httpx
+import tiktoken
+from openai import AsyncOpenAI, OpenAI
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=4)
+def _get_encoding(model: str):
+    """
+    Load the tiktoken encoding for a model, falling back to cl100k_base,
+    or None if no vocab is available (e.g. offline). Cached because
+    encoder construction costs ~100ms while a cached lookup is free, and
+    every OpenAIService() would otherwise rebuild it
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            return None
+
+
+@functools.lru_cache(maxsize=4)
+def _boundary_token_sets(model: str):
+    """
+    Precompute which token ids in the model's vocabulary contain a newline
+    and which end a sentence. One pass over the vocabulary at first use,
+    cached per model, replaces a decode_single_token_bytes call per token
+    scanned in every _find_chunk_boundary invocation
+    """
+    enc = _get_encoding(model)
+    newline_ids = set()
+    sentence_ids = set()
+    if enc is not None:
+        for i in range(enc.n_vocab):
+            try:
+                token = enc.decode_single_token_bytes(i)
+            except KeyError:
+                continue  # gaps in the id space (special tokens)
+            if b'\n' in token:
+                newline_ids.add(i)
+            elif token.rstrip(b' ').endswith((b'.', b'!', b'?')):
+                sentence_ids.add(i)
+    return frozenset(newline_ids), frozenset(sentence_ids)
+
+
+@functools.lru_cache(maxsize=128)
+def _count_tokens(model: str, text: str) -> int:
+    """
+    Token count for a single string, memoized. Callers routinely estimate
+    the same text more than once (e.g. a whole transcript both before and
+    inside chunk_text), and memoizing trades a little memory for skipping
+    the repeat BPE pass
+    """
+    enc = _get_encoding(model)
+    if enc is None:
+        return len(text) // 4
+    # disallowed_special=() keeps transcripts that happen to contain
+    # special-token text (e.g. "<|endoftext|>") from raising
+    return len(enc.encode(text, disallowed_special=()))
+
+
+# Compiled once; chunk_text runs on every summarization request
+_PARA_RE = re.compile(r'\n\s*\n')
+_SENT_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Bullet lines ("- item", "• item", "* item") in model output; one
+# C-level scan replaces per-line startswith/strip chains
+_BULLET_RE = re.compile(r'^\s*[-•*]\s+(.+?)\s*$', re.MULTILINE)
+
+# Action-item dedup: strip punctuation, then drop filler words so
+# rephrasings of the same task produce the same fingerprint
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_STOPWORDS = frozenset({
+    'a', 'an', 'the', 'to', 'for', 'of', 'in', 'on', 'at', 'about',
+    'with', 'and', 'or', 're', 'regarding', 'send', 'make', 'get',
+})
 
 
 class OpenAIService:
@@ -23,83 +108,209 @@ class OpenAIService:
     
     # Max tokens per chunk (leave room for prompt and response)
     CHUNK_SIZE = 12000  # ~3000 words per chunk
-    
+
+    # Max chunk requests in flight at once (stay under OpenAI rate limits)
+    MAX_CONCURRENT_REQUESTS = 8
+
+    # Max chunk summaries combined in a single prompt; above this the
+    # combine step reduces hierarchically in groups of this size
+    COMBINE_GROUP_SIZE = 8
+
+    # Inputs below this many tokens aren't worth an API round trip
+    MIN_SUMMARY_TOKENS = 50
+
+    # When slicing by token ids, look back up to this many tokens for a
+    # paragraph/sentence boundary before hard-splitting mid-sentence
+    BOUNDARY_SCAN_TOKENS = 200
+
     def __init__(self):
         """Initialize OpenAI service with API key"""
         self.api_key = os.getenv('OPENAI_API_KEY')
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set")
-        
-        self.client = OpenAI(api_key=self.api_key)
+
+        # Keep-alive pooling so the chunked map-reduce path reuses TLS
+        # connections instead of paying a handshake per chunk call
+        self._http_limits = httpx.Limits(max_keepalive_connections=20, keepalive_expiry=300)
+        self.client = OpenAI(
+            api_key=self.api_key,
+            http_client=httpx.Client(limits=self._http_limits)
+        )
         self.model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
         self.context_limit = self.MODEL_LIMITS.get(self.model, 7000)
-    
+
+        # Exact tokenizer for the configured model; chunking against real
+        # token counts packs chunks to the limit instead of guessing
+        self._enc = _get_encoding(self.model)
+        self._newline_ids, self._sentence_ids = _boundary_token_sets(self.model)
+
+    def _async_client(self) -> AsyncOpenAI:
+        """
+        Build an AsyncOpenAI client for the event loop about to use it.
+        Pooled keepalive connections are bound to the loop they were opened
+        on, so a client cached in __init__ and reused across asyncio.run
+        calls fails with 'Event loop is closed'. Each run opens (and, via
+        async with, closes) its own client, still pooling within that run
+        """
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            http_client=httpx.AsyncClient(limits=self._http_limits)
+        )
+
     def estimate_tokens(self, text: str) -> int:
         """
-        Rough estimate of token count (1 token ≈ 4 characters for English)
-        This is a conservative estimate; actual tokenization may differ
+        Count tokens with the model's tiktoken encoder (memoized per string).
+        Falls back to the rough 1 token ≈ 4 characters heuristic if the
+        encoder could not be loaded
         """
-        return len(text) // 4
-    
+        return _count_tokens(self.model, text)
+
+    def estimate_tokens_batch(self, texts: List[str]) -> List[int]:
+        """
+        Count tokens for several strings at once. encode_ordinary_batch
+        encodes across Rust threads with the GIL released, so one call
+        replaces a Python-level loop of per-string encodes. Falls back to
+        per-string estimates when no encoder is loaded
+        """
+        if self._enc is None:
+            return [self.estimate_tokens(text) for text in texts]
+        return [len(ids) for ids in self._enc.encode_ordinary_batch(texts)]
+
     def chunk_text(self, text: str, max_tokens: int = None) -> List[str]:
         """
         Split text into chunks that fit within token limits.
-        Tries to split on paragraph boundaries, then sentences.
-        
+        Encodes the text once and slices the token-id array, so chunking is
+        a single linear BPE pass instead of re-tokenizing candidate
+        substrings as a chunk grows. Each cut prefers a paragraph or
+        sentence boundary near the token limit.
+
         Args:
             text: Text to chunk
             max_tokens: Maximum tokens per chunk (defaults to CHUNK_SIZE)
-        
+
         Returns:
             List of text chunks
         """
         if max_tokens is None:
             max_tokens = self.CHUNK_SIZE
-        
+
+        # BPE never yields more tokens than input bytes, so a byte count
+        # within the limit proves the text fits without tokenizing it
+        if len(text.encode('utf-8')) <= max_tokens:
+            return [text]
+
         # If text is small enough, return as single chunk
         if self.estimate_tokens(text) <= max_tokens:
             return [text]
-        
+
+        # No encoder loaded: fall back to estimate-driven accumulation
+        if self._enc is None:
+            return self._chunk_text_by_paragraphs(text, max_tokens)
+
+        ids = self._enc.encode(text, disallowed_special=())
+
+        # Every chunk spans at least max_tokens - BOUNDARY_SCAN_TOKENS ids,
+        # which bounds the output length up front; filling a preallocated
+        # list by index avoids append's incremental capacity growth
+        step = max(max_tokens - self.BOUNDARY_SCAN_TOKENS, 1)
+        chunks = [None] * -(-len(ids) // step)
+        count = 0
+        start = 0
+        while start < len(ids):
+            end = min(start + max_tokens, len(ids))
+            if end < len(ids):
+                end = self._find_chunk_boundary(ids, start, end)
+            chunks[count] = self._enc.decode(ids[start:end])
+            count += 1
+            start = end
+        del chunks[count:]
+
+        return chunks if chunks else [text]  # Fallback to original text
+
+    def _find_chunk_boundary(self, ids: List[int], start: int, end: int) -> int:
+        """
+        Pick where to cut a token-id slice: after the last token containing
+        a newline within the scan window, else after the last
+        sentence-ending token, else at the hard limit. Boundary tokens are
+        looked up in the precomputed per-model sets, so the scan is pure
+        set membership with no decoding
+        """
+        lo = max(start + 1, end - self.BOUNDARY_SCAN_TOKENS)
+        sentence_end = None
+
+        for j in range(end - 1, lo - 1, -1):
+            if ids[j] in self._newline_ids:
+                return j + 1
+            if sentence_end is None and ids[j] in self._sentence_ids:
+                sentence_end = j + 1
+
+        return sentence_end if sentence_end is not None else end
+
+    def _chunk_text_by_paragraphs(self, text: str, max_tokens: int) -> List[str]:
+        """
+        Estimate-driven chunking for when no BPE encoder is available:
+        accumulate paragraphs (then sentences) against a running count
+        """
         chunks = []
-        
+
         # Split by paragraphs (double newline)
-        paragraphs = re.split(r'\n\s*\n', text)
-        
-        current_chunk = ""
+        paragraphs = _PARA_RE.split(text)
+
+        # Accumulate parts with a running token count; re-estimating the
+        # concatenated chunk on every append is O(n^2) in text length
+        current_parts = []
+        current_tokens = 0
+
         for paragraph in paragraphs:
             paragraph = paragraph.strip()
             if not paragraph:
                 continue
-            
+
+            paragraph_tokens = self.estimate_tokens(paragraph)
+            joiner_tokens = 2 if current_parts else 0  # accounts for "\n\n"
+
             # Check if adding this paragraph would exceed limit
-            test_chunk = current_chunk + "\n\n" + paragraph if current_chunk else paragraph
-            
-            if self.estimate_tokens(test_chunk) <= max_tokens:
-                current_chunk = test_chunk
+            if current_tokens + joiner_tokens + paragraph_tokens <= max_tokens:
+                current_parts.append(paragraph)
+                current_tokens += joiner_tokens + paragraph_tokens
+                continue
+
+            # If current chunk has content, save it
+            if current_parts:
+                chunks.append("\n\n".join(current_parts))
+                current_parts = []
+                current_tokens = 0
+
+            # If single paragraph is too large, split by sentences
+            if paragraph_tokens > max_tokens:
+                sentences = _SENT_RE.split(paragraph)
+                for sentence in sentences:
+                    sentence_tokens = self.estimate_tokens(sentence)
+                    joiner_tokens = 1 if current_parts else 0  # accounts for " "
+
+                    if current_tokens + joiner_tokens + sentence_tokens <= max_tokens:
+                        current_parts.append(sentence)
+                        current_tokens += joiner_tokens + sentence_tokens
+                    else:
+                        if current_parts:
+                            chunks.append(" ".join(current_parts))
+                        current_parts = [sentence]
+                        current_tokens = sentence_tokens
+
+                # Flush the sentence remainder so paragraph accumulation
+                # restarts with a clean "\n\n"-joined chunk
+                if current_parts:
+                    chunks.append(" ".join(current_parts))
+                    current_parts = []
+                    current_tokens = 0
             else:
-                # If current chunk has content, save it
-                if current_chunk:
-                    chunks.append(current_chunk)
-                    current_chunk = ""
-                
-                # If single paragraph is too large, split by sentences
-                if self.estimate_tokens(paragraph) > max_tokens:
-                    sentences = re.split(r'(?<=[.!?])\s+', paragraph)
-                    for sentence in sentences:
-                        test_chunk = current_chunk + " " + sentence if current_chunk else sentence
-                        if self.estimate_tokens(test_chunk) <= max_tokens:
-                            current_chunk = test_chunk
-                        else:
-                            if current_chunk:
-                                chunks.append(current_chunk)
-                            current_chunk = sentence
-                else:
-                    current_chunk = paragraph
-        
+                current_parts = [paragraph]
+                current_tokens = paragraph_tokens
+
         # Add remaining chunk
-        if current_chunk:
-            chunks.append(current_chunk)
-        
+        if current_parts:
+            chunks.append("\n\n".join(current_parts))
+
         return chunks if chunks else [text]  # Fallback to original text
     
     def summarize_transcription(self, transcription_text: str) -> str:
@@ -117,36 +328,45 @@ class OpenAIService:
             str: The generated summary
         """
         try:
-            # Estimate if we need chunking
             estimated_tokens = self.estimate_tokens(transcription_text)
-            
+
+            # A few words of input: echo them back instead of paying a
+            # network round trip for a summary of nothing
+            if estimated_tokens < self.MIN_SUMMARY_TOKENS:
+                return f"**Summary:** {transcription_text.strip()}"
+
+            # Identical text summarized before (user refresh, retry)?
+            # The model is part of the key so upgrades invalidate cleanly
+            cache_key = hashlib.sha256(
+                f'{self.model}::{transcription_text}'.encode()
+            ).hexdigest()
+            cached = storage.get_cached_summary(cache_key)
+            if cached is not None:
+                return cached
+
             # If small enough, process normally
             if estimated_tokens <= self.CHUNK_SIZE:
-                return self._summarize_single(transcription_text)
+                summary = self._summarize_single(transcription_text)
+                storage.cache_summary(cache_key, summary)
+                return summary
             
             # For large transcriptions, use map-reduce approach
-            print(f"Long transcription detected (~{estimated_tokens} tokens). Using chunking...")
+            logger.info("Long transcription detected (~%d tokens). Using chunking...",
+                        estimated_tokens)
             
             # Step 1: Split into chunks
             chunks = self.chunk_text(transcription_text)
-            print(f"Split into {len(chunks)} chunks")
-            
-            # Step 2: Summarize each chunk
-            chunk_summaries = []
-            for i, chunk in enumerate(chunks, 1):
-                print(f"Processing chunk {i}/{len(chunks)}...")
-                summary = self._summarize_chunk(chunk, i, len(chunks))
-                chunk_summaries.append(summary)
-            
-            # Step 3: Combine summaries
-            if len(chunk_summaries) == 1:
-                return chunk_summaries[0]
-            
-            print("Combining chunk summaries...")
-            return self._combine_summaries(chunk_summaries)
+            logger.info("Split into %d chunks", len(chunks))
+
+            # Steps 2-3: summarize chunks and reduce the summaries inside a
+            # single event loop
+            summary = asyncio.run(self._summarize_chunked(chunks))
+
+            storage.cache_summary(cache_key, summary)
+            return summary
         
         except Exception as e:
-            print(f"OpenAI summarization error: {str(e)}")
+            logger.exception("OpenAI summarization error")
             raise Exception(f"Failed to generate summary: {str(e)}")
     
     def _summarize_single(self, text: str) -> str:
@@ -186,9 +406,53 @@ Adapt your summary to the content type - whether it's a meeting, lecture, voice
         
         return response.choices[0].message.content.strip()
     
-    def _summarize_chunk(self, chunk: str, chunk_num: int, total_chunks: int) -> str:
+    async def _summarize_chunked(self, chunks: List[str]) -> str:
+        """
+        Map-reduce over chunks on one event loop: summarize every chunk
+        concurrently, then tree-reduce the summaries. With many chunks
+        (multi-hour transcriptions) a single combine prompt would blow past
+        the context/output budget, so summaries are combined in groups of
+        COMBINE_GROUP_SIZE concurrently, recursing on the group results
+        until one summary remains
+        """
+        async with self._async_client() as aclient:
+            logger.info("Processing %d chunks concurrently...", len(chunks))
+            summaries = await self._summarize_chunks_async(aclient, chunks)
+
+            while len(summaries) > self.COMBINE_GROUP_SIZE:
+                groups = [
+                    summaries[i:i + self.COMBINE_GROUP_SIZE]
+                    for i in range(0, len(summaries), self.COMBINE_GROUP_SIZE)
+                ]
+                logger.info("Reducing %d summaries in %d groups...", len(summaries), len(groups))
+                summaries = await self._combine_groups_async(aclient, groups)
+
+            if len(summaries) == 1:
+                return summaries[0]
+
+            logger.info("Combining chunk summaries...")
+            return await self._combine_group(aclient, summaries)
+
+    async def _summarize_chunks_async(self, aclient: AsyncOpenAI, chunks: List[str]) -> List[str]:
+        """
+        Summarize all chunks concurrently with asyncio.gather.
+        Chunk summaries are independent, so wall time is bounded by the
+        slowest call rather than the sum of all calls.
+        """
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+
+        async def summarize_one(chunk: str, chunk_num: int) -> str:
+            async with semaphore:
+                return await self._summarize_chunk(aclient, chunk, chunk_num, len(chunks))
+
+        return list(await asyncio.gather(
+            *(summarize_one(chunk, i) for i, chunk in enumerate(chunks, 1))
+        ))
+
+    async def _summarize_chunk(self, aclient: AsyncOpenAI, chunk: str,
+                               chunk_num: int, total_chunks: int) -> str:
         """Summarize a single chunk of a larger transcription"""
-        system_prompt = """You are summarizing part of a longer audio transcription. 
+        system_prompt = """You are summarizing part of a longer audio transcription.
 Focus on extracting the key information from this segment. Be comprehensive but concise.
 Capture main topics, important points, decisions, action items, and notable details."""
 
@@ -197,7 +461,7 @@ Please summarize the key information from this segment:
 
 {chunk}"""
 
-        response = self.client.chat.completions.create(
+        response = await aclient.chat.completions.create(
             model=self.model,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -206,11 +470,22 @@ Please summarize the key information from this segment:
             temperature=0.7,
             max_tokens=800
         )
-        
+
         return response.choices[0].message.content.strip()
-    
-    def _combine_summaries(self, summaries: List[str]) -> str:
-        """Combine multiple chunk summaries into a cohesive final summary"""
+
+    async def _combine_groups_async(self, aclient: AsyncOpenAI,
+                                    groups: List[List[str]]) -> List[str]:
+        """Combine each group of summaries concurrently"""
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+
+        async def combine_one(group: List[str]) -> str:
+            async with semaphore:
+                return await self._combine_group(aclient, group)
+
+        return list(await asyncio.gather(*(combine_one(group) for group in groups)))
+
+    async def _combine_group(self, aclient: AsyncOpenAI, summaries: List[str]) -> str:
+        """Combine one group of summaries into a single summary"""
         combined_text = "\n\n---\n\n".join(
             [f"**Section {i}:**\n{summary}" for i, summary in enumerate(summaries, 1)]
         )
@@ -229,7 +504,7 @@ Please combine them into one cohesive, well-organized summary:
 
 {combined_text}"""
 
-        response = self.client.chat.completions.create(
+        response = await aclient.chat.completions.create(
             model=self.model,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -238,7 +513,7 @@ Please combine them into one cohesive, well-organized summary:
             temperature=0.75,
             max_tokens=2000
         )
-        
+
         return response.choices[0].message.content.strip()
     
     def extract_action_items(self, transcription_text: str) -> list:
@@ -253,29 +528,45 @@ Please combine them into one cohesive, well-organized summary:
         """
         try:
             estimated_tokens = self.estimate_tokens(transcription_text)
-            
+
+            # Too short to contain real action items
+            if estimated_tokens < self.MIN_SUMMARY_TOKENS:
+                return []
+
             # If small enough, process normally
             if estimated_tokens <= self.CHUNK_SIZE:
-                return self._extract_action_items_single(transcription_text)
-            
-            # For large transcriptions, process chunks and combine
-            print(f"Long transcription detected for action items. Using chunking...")
+                return asyncio.run(self._extract_action_items_async([transcription_text]))[0]
+
+            # For large transcriptions, process chunks concurrently and combine
+            logger.info("Long transcription detected for action items. Using chunking...")
             chunks = self.chunk_text(transcription_text)
-            
+
+            logger.info("Extracting action items from %d chunks concurrently...", len(chunks))
+            chunk_items = asyncio.run(self._extract_action_items_async(chunks))
+
             all_action_items = []
-            for i, chunk in enumerate(chunks, 1):
-                print(f"Extracting action items from chunk {i}/{len(chunks)}...")
-                items = self._extract_action_items_single(chunk)
+            for items in chunk_items:
                 all_action_items.extend(items)
-            
+
             # Deduplicate similar action items
             return self._deduplicate_action_items(all_action_items)
         
-        except Exception as e:
-            print(f"OpenAI action items extraction error: {str(e)}")
+        except Exception:
+            logger.exception("OpenAI action items extraction error")
             return []
     
-    def _extract_action_items_single(self, text: str) -> list:
+    async def _extract_action_items_async(self, chunks: List[str]) -> List[list]:
+        """Extract action items from all chunks concurrently on one event loop"""
+        async with self._async_client() as aclient:
+            semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+
+            async def extract_one(chunk: str) -> list:
+                async with semaphore:
+                    return await self._extract_action_items_single(aclient, chunk)
+
+            return list(await asyncio.gather(*(extract_one(chunk) for chunk in chunks)))
+
+    async def _extract_action_items_single(self, aclient: AsyncOpenAI, text: str) -> list:
         """Extract action items from a single text chunk"""
         prompt = f"""Extract all actionable tasks, to-dos, reminders, or follow-ups from the following transcription.
 This could include things to research, people to contact, tasks to complete, or ideas to pursue.
@@ -284,7 +575,7 @@ Return only the action items as a bullet-point list.
 Transcription:
 {text}"""
 
-        response = self.client.chat.completions.create(
+        response = await aclient.chat.completions.create(
             model=self.model,
             messages=[
                 {"role": "user", "content": prompt}
@@ -294,29 +585,34 @@ Transcription:
         )
         
         action_items_text = response.choices[0].message.content.strip()
-        # Split into list
-        action_items = [
-            item.strip('- ').strip()
-            for item in action_items_text.split('\n')
-            if item.strip() and (item.strip().startswith('-') or item.strip().startswith('•'))
-        ]
-        
-        return action_items
+
+        return [m.group(1) for m in _BULLET_RE.finditer(action_items_text)]
     
+    def _fingerprint_action_item(self, item: str) -> frozenset:
+        """
+        Normalized token set for near-duplicate detection: lowercase,
+        punctuation stripped, stopwords dropped, word order ignored.
+        'Email Sarah about the proposal' and 'Send email to Sarah re: proposal'
+        collapse to the same fingerprint
+        """
+        words = _PUNCT_RE.sub('', item.lower()).split()
+        fingerprint = frozenset(w for w in words if w not in _STOPWORDS)
+        # All-stopword items still need a non-empty key
+        return fingerprint or frozenset(words)
+
     def _deduplicate_action_items(self, items: List[str]) -> list:
-        """Remove duplicate or very similar action items"""
+        """Remove duplicate or near-duplicate action items, keeping first seen"""
         if not items:
             return []
-        
-        # Simple deduplication by exact match and case-insensitive match
+
         seen = set()
         unique_items = []
-        
+
         for item in items:
-            item_lower = item.lower().strip()
-            if item_lower not in seen:
-                seen.add(item_lower)
+            fingerprint = self._fingerprint_action_item(item)
+            if fingerprint not in seen:
+                seen.add(fingerprint)
                 unique_items.append(item)
-        
+
         return unique_items
 
@@ -0,0 +1,110 @@
+"""
+Shared storage
+Transcription and summary records, shared between the Flask app and
+background task workers.
+
+Backed by Redis with per-key TTLs when REDIS_URL is set, so memory is
+bounded, records survive restarts, and web/worker processes share state.
+Pair with `maxmemory 512mb` / `maxmemory-policy allkeys-lru` on the Redis
+server for a hard ceiling. Without REDIS_URL, plain in-process dicts are
+used (single-process local development only).
+"""
+
+import json
+import os
+
+import redis
+
+# Records expire after this many seconds
+TTL_SECONDS = int(os.getenv('STORAGE_TTL_SECONDS', str(86400)))
+# Audio-content digests stay mapped longer so repeat uploads keep hitting
+AUDIO_CACHE_TTL_SECONDS = int(os.getenv('AUDIO_CACHE_TTL_SECONDS', str(7 * 86400)))
+# Summaries are deterministic per (model, text), so they can live a long time
+SUMMARY_CACHE_TTL_SECONDS = int(os.getenv('SUMMARY_CACHE_TTL_SECONDS', str(30 * 86400)))
+
+REDIS_URL = os.getenv('REDIS_URL')
+_redis = redis.Redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+
+# In-memory fallback (for demo purposes; single-process only)
+_transcriptions = {}
+_summaries = {}
+_transcript_id_map = {}  # AssemblyAI transcript_id -> transcription_id
+_audio_cache = {}  # sha256 of audio bytes -> transcription_id
+_summary_cache = {}  # sha256 of model + transcription text -> summary
+
+
+def get_transcription(transcription_id: str) -> dict | None:
+    """Fetch a transcription record, or None if missing/expired"""
+    if _redis:
+        data = _redis.get(f'tr:{transcription_id}')
+        return json.loads(data) if data else None
+    return _transcriptions.get(transcription_id)
+
+
+def save_transcription(record: dict):
+    """Store a transcription record keyed by its 'id'"""
+    if _redis:
+        _redis.set(f"tr:{record['id']}", json.dumps(record), ex=TTL_SECONDS)
+    else:
+        _transcriptions[record['id']] = record
+
+
+def get_summary(transcription_id: str) -> dict | None:
+    """Fetch a summary record, or None if missing/expired"""
+    if _redis:
+        data = _redis.get(f'sm:{transcription_id}')
+        return json.loads(data) if data else None
+    return _summaries.get(transcription_id)
+
+
+def save_summary(transcription_id: str, record: dict):
+    """Store a summary record for a transcription"""
+    if _redis:
+        _redis.set(f'sm:{transcription_id}', json.dumps(record), ex=TTL_SECONDS)
+    else:
+        _summaries[transcription_id] = record
+
+
+def map_transcript_id(transcript_id: str, transcription_id: str):
+    """Remember which transcription an AssemblyAI transcript belongs to"""
+    if _redis:
+        _redis.set(f'tid:{transcript_id}', transcription_id, ex=TTL_SECONDS)
+    else:
+        _transcript_id_map[transcript_id] = transcription_id
+
+
+def get_transcription_id(transcript_id: str) -> str | None:
+    """Look up our transcription id for an AssemblyAI transcript id"""
+    if _redis:
+        return _redis.get(f'tid:{transcript_id}')
+    return _transcript_id_map.get(transcript_id)
+
+
+def cache_audio_digest(audio_digest: str, transcription_id: str):
+    """Remember which transcription was produced from this audio content"""
+    if _redis:
+        _redis.set(f'audiohash:{audio_digest}', transcription_id, ex=AUDIO_CACHE_TTL_SECONDS)
+    else:
+        _audio_cache[audio_digest] = transcription_id
+
+
+def get_cached_transcription_id(audio_digest: str) -> str | None:
+    """Look up a prior transcription for identical audio content"""
+    if _redis:
+        return _redis.get(f'audiohash:{audio_digest}')
+    return _audio_cache.get(audio_digest)
+
+
+def cache_summary(text_digest: str, summary: str):
+    """Remember the summary generated for this (model, text) digest"""
+    if _redis:
+        _redis.set(f'sum:{text_digest}', summary, ex=SUMMARY_CACHE_TTL_SECONDS)
+    else:
+        _summary_cache[text_digest] = summary
+
+
+def get_cached_summary(text_digest: str) -> str | None:
+    """Look up a prior summary for an identical (model, text) digest"""
+    if _redis:
+        return _redis.get(f'sum:{text_digest}')
+    return _summary_cache.get(text_digest)
@@ -0,0 +1,99 @@
+"""
+Background tasks
+Celery tasks for transcription and summarization, so long network-bound
+API calls run on an I/O-sized worker pool instead of Flask request threads
+
+Run a worker with:
+    celery -A tasks worker --pool=threads --concurrency=100
+"""
+
+import os
+from datetime import datetime
+
+from celery import Celery
+
+import storage
+from services.assemblyai_service import AssemblyAIService
+from services.openai_service import OpenAIService
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+celery_app = Celery('note_taker', broker=REDIS_URL, backend=REDIS_URL)
+celery_app.conf.update(
+    # Workload is pure I/O (external API calls), so a large thread pool is safe
+    worker_concurrency=int(os.getenv('WORKER_CONCURRENCY', '100')),
+    worker_pool=os.getenv('WORKER_POOL', 'threads'),
+)
+
+# Lazy singletons so the web process can import this module (to enqueue)
+# without constructing services it never calls directly
+_assemblyai_service = None
+_openai_service = None
+
+
+def get_assemblyai_service() -> AssemblyAIService:
+    global _assemblyai_service
+    if _assemblyai_service is None:
+        _assemblyai_service = AssemblyAIService()
+    return _assemblyai_service
+
+
+def get_openai_service() -> OpenAIService:
+    global _openai_service
+    if _openai_service is None:
+        _openai_service = OpenAIService()
+    return _openai_service
+
+
+@celery_app.task
+def transcribe_task(transcription_id: str, audio_source: str):
+    """
+    Run AssemblyAI transcription for an audio URL and store the result.
+    The web process always streams uploads to AssemblyAI first and passes
+    the upload URL here, so the worker never depends on the web host's disk
+    """
+    record = storage.get_transcription(transcription_id)
+    if record is None:
+        return
+
+    record['status'] = 'processing'
+    storage.save_transcription(record)
+
+    result = get_assemblyai_service().transcribe_audio(audio_source)
+
+    record['status'] = result['status']
+    record['text'] = result.get('text')
+    record['error'] = result.get('error')
+    record['transcript_id'] = result.get('transcript_id')
+    storage.save_transcription(record)
+    if result.get('transcript_id'):
+        storage.map_transcript_id(result['transcript_id'], transcription_id)
+
+
+@celery_app.task
+def summarize_task(transcription_id: str):
+    """Generate and store an OpenAI summary for a completed transcription"""
+    record = storage.get_transcription(transcription_id)
+    if record is None or not record.get('text'):
+        return
+
+    try:
+        summary = get_openai_service().summarize_transcription(record['text'])
+    except Exception as e:
+        # Persist the failure so clients polling /api/notes see it instead
+        # of waiting forever for a summary that will never arrive
+        storage.save_summary(transcription_id, {
+            'transcription_id': transcription_id,
+            'summary': None,
+            'status': 'error',
+            'error': str(e),
+            'created_at': datetime.utcnow().isoformat()
+        })
+        raise
+
+    storage.save_summary(transcription_id, {
+        'transcription_id': transcription_id,
+        'summary': summary,
+        'status': 'completed',
+        'created_at': datetime.utcnow().isoformat()
+    })
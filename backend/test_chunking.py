@@ -4,48 +4,90 @@ Run with: python test_chunking.py
 """
 
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 from services.openai_service import OpenAIService
 
+# Shared fixtures, built once at import; the repeated string multiplication
+# is an O(n) copy each time it runs, so per-test construction is wasted work
+_SMALL_TEXT = "This is a short transcription that should not be chunked." * 10
+_LARGE_TEXT = ("This is a paragraph about an important topic. " * 50 + "\n\n") * 200
+_MARKER_TEXT = "\n\n".join(
+    f"Paragraph {i}: " + "content " * 100 for i in range(1, 21)
+)
+_BOUNDARY_TEXT = "\n\n".join(
+    f"This is the {ordinal} paragraph. " * 1000
+    for ordinal in ("first", "second", "third")
+)
+
+# One service instance shared by every test; the tests only read from it,
+# and constructing OpenAIService per test repeats env lookups, HTTP client
+# setup and encoder loading for no benefit
+_SERVICE = OpenAIService() if os.getenv('OPENAI_API_KEY') else None
+
+
+def _ends_properly(chunk):
+    """
+    True if the chunk's last non-space/tab character is a period or newline.
+    Walks back from the end instead of rstrip().endswith(), which would
+    allocate a stripped copy of the whole chunk to inspect one character
+    """
+    i = len(chunk)
+    while i and chunk[i - 1] in ' \t\r':
+        i -= 1
+    return i > 0 and chunk[i - 1] in '.\n'
+
 
 def test_token_estimation():
     """Test token estimation"""
-    service = OpenAIService() if os.getenv('OPENAI_API_KEY') else None
-    
-    if not service:
+    service = _SERVICE
+    if service is None:
         print("⚠️  Skipping: OPENAI_API_KEY not set")
         return
-    
+
     print("Testing token estimation...")
-    
-    # Test cases
-    test_cases = [
-        ("Hello world", 3),  # ~3 tokens
-        ("This is a longer sentence with more words.", 11),  # ~11 tokens
-        ("A" * 400, 100),  # 400 chars = ~100 tokens
-    ]
-    
-    for text, expected in test_cases:
-        estimated = service.estimate_tokens(text)
-        print(f"  Text length: {len(text)} chars → {estimated} tokens (expected ~{expected})")
-        assert abs(estimated - expected) <= 2, f"Estimation off: {estimated} vs {expected}"
-    
+
+    if service._enc is None:
+        # Heuristic fallback (no BPE vocab available): chars/4
+        test_cases = [
+            ("Hello world", 3),  # ~3 tokens
+            ("This is a longer sentence with more words.", 11),  # ~11 tokens
+            ("A" * 400, 100),  # 400 chars = ~100 tokens
+        ]
+
+        for text, expected in test_cases:
+            estimated = service.estimate_tokens(text)
+            print(f"  Text length: {len(text)} chars → {estimated} tokens (expected ~{expected})")
+            assert abs(estimated - expected) <= 2, f"Estimation off: {estimated} vs {expected}"
+    else:
+        # Exact BPE counts (ranges cover cl100k/o200k vocab differences)
+        test_cases = [
+            ("Hello world", 1, 4),
+            ("This is a longer sentence with more words.", 6, 15),
+            ("A" * 400, 1, 60),  # BPE compresses repeated chars heavily
+        ]
+
+        for text, low, high in test_cases:
+            estimated = service.estimate_tokens(text)
+            print(f"  Text length: {len(text)} chars → {estimated} tokens (expected {low}-{high})")
+            assert low <= estimated <= high, f"Estimation off: {estimated} not in [{low}, {high}]"
+
     print("✅ Token estimation tests passed\n")
 
 
 def test_chunking_small_text():
     """Test that small text doesn't get chunked"""
-    service = OpenAIService() if os.getenv('OPENAI_API_KEY') else None
-    
-    if not service:
+    service = _SERVICE
+    if service is None:
         print("⚠️  Skipping: OPENAI_API_KEY not set")
         return
-    
+
     print("Testing small text chunking...")
     
-    small_text = "This is a short transcription that should not be chunked." * 10
-    chunks = service.chunk_text(small_text)
-    
-    print(f"  Input: {len(small_text)} chars (~{service.estimate_tokens(small_text)} tokens)")
+    chunks = service.chunk_text(_SMALL_TEXT)
+
+    print(f"  Input: {len(_SMALL_TEXT)} chars (~{service.estimate_tokens(_SMALL_TEXT)} tokens)")
     print(f"  Chunks: {len(chunks)}")
     
     assert len(chunks) == 1, "Small text should remain as single chunk"
@@ -54,57 +96,56 @@ def test_chunking_small_text():
 
 def test_chunking_large_text():
     """Test that large text gets chunked properly"""
-    service = OpenAIService() if os.getenv('OPENAI_API_KEY') else None
-    
-    if not service:
+    service = _SERVICE
+    if service is None:
         print("⚠️  Skipping: OPENAI_API_KEY not set")
         return
-    
+
     print("Testing large text chunking...")
     
-    # Create a large text (simulate ~50k token transcription)
-    paragraph = "This is a paragraph about an important topic. " * 50
-    large_text = (paragraph + "\n\n") * 200  # ~200k chars = ~50k tokens
-    
-    chunks = service.chunk_text(large_text, max_tokens=5000)
-    
-    print(f"  Input: {len(large_text)} chars (~{service.estimate_tokens(large_text)} tokens)")
+    # ~200k chars, simulating a ~50k token transcription
+    chunks = service.chunk_text(_LARGE_TEXT, max_tokens=5000)
+
+    print(f"  Input: {len(_LARGE_TEXT)} chars (~{service.estimate_tokens(_LARGE_TEXT)} tokens)")
     print(f"  Chunks: {len(chunks)}")
-    
-    for i, chunk in enumerate(chunks, 1):
-        tokens = service.estimate_tokens(chunk)
-        print(f"    Chunk {i}: {len(chunk)} chars (~{tokens} tokens)")
-        assert tokens <= 5000, f"Chunk {i} exceeds max tokens"
-    
+
+    # One batch call counts tokens for every chunk in parallel on the
+    # Rust side instead of paying a Python→Rust round trip per chunk
+    token_counts = service.estimate_tokens_batch(chunks)
+
+    # Emit the per-chunk report as one write; a print per chunk flushes
+    # (and interleaves with the other parallel tests) line by line
+    print("\n".join(
+        f"    Chunk {i}: {len(chunk)} chars (~{tokens} tokens)"
+        for i, (chunk, tokens) in enumerate(zip(chunks, token_counts), 1)
+    ))
+
+    assert max(token_counts) <= 5000, "A chunk exceeds max tokens"
     assert len(chunks) > 1, "Large text should be split into multiple chunks"
     print("✅ Large text test passed\n")
 
 
 def test_chunking_preserves_content():
     """Test that chunking doesn't lose content"""
-    service = OpenAIService() if os.getenv('OPENAI_API_KEY') else None
-    
-    if not service:
+    service = _SERVICE
+    if service is None:
         print("⚠️  Skipping: OPENAI_API_KEY not set")
         return
-    
+
     print("Testing content preservation...")
     
-    # Create text with distinct markers
-    paragraphs = [f"Paragraph {i}: " + "content " * 100 for i in range(1, 21)]
-    large_text = "\n\n".join(paragraphs)
-    
-    chunks = service.chunk_text(large_text, max_tokens=2000)
+    # Text with distinct markers
+    chunks = service.chunk_text(_MARKER_TEXT, max_tokens=2000)
     
     # Combine chunks back together
     combined = "\n\n".join(chunks)
-    combined_normalized = " ".join(combined.split())
-    original_normalized = " ".join(large_text.split())
-    
-    # Check if all content is preserved (accounting for whitespace differences)
-    content_preserved = all(f"Paragraph {i}:" in combined for i in range(1, 21))
+
+    # Check if all content is preserved: one regex pass over the combined
+    # text instead of 20 separate substring scans
+    found = set(map(int, re.findall(r"Paragraph (\d+):", combined)))
+    content_preserved = found >= set(range(1, 21))
     
-    print(f"  Original length: {len(large_text)} chars")
+    print(f"  Original length: {len(_MARKER_TEXT)} chars")
     print(f"  Combined length: {len(combined)} chars")
     print(f"  All paragraphs preserved: {content_preserved}")
     
@@ -114,64 +155,67 @@ def test_chunking_preserves_content():
 
 def test_chunk_boundary_detection():
     """Test that chunking prefers paragraph boundaries"""
-    service = OpenAIService() if os.getenv('OPENAI_API_KEY') else None
-    
-    if not service:
+    service = _SERVICE
+    if service is None:
         print("⚠️  Skipping: OPENAI_API_KEY not set")
         return
-    
+
     print("Testing chunk boundary detection...")
     
-    # Create text with clear paragraph boundaries
-    paragraph1 = "This is the first paragraph. " * 1000
-    paragraph2 = "This is the second paragraph. " * 1000
-    paragraph3 = "This is the third paragraph. " * 1000
-    
-    text = paragraph1 + "\n\n" + paragraph2 + "\n\n" + paragraph3
-    
-    chunks = service.chunk_text(text, max_tokens=4000)
-    
-    print(f"  Input: {len(text)} chars (~{service.estimate_tokens(text)} tokens)")
+    # Text with clear paragraph boundaries
+    chunks = service.chunk_text(_BOUNDARY_TEXT, max_tokens=4000)
+
+    boundary_tokens = service.estimate_tokens(_BOUNDARY_TEXT)
+    print(f"  Input: {len(_BOUNDARY_TEXT)} chars (~{boundary_tokens} tokens)")
     print(f"  Chunks: {len(chunks)}")
     
     # Check that chunks don't end mid-sentence
     for i, chunk in enumerate(chunks, 1):
-        ends_properly = chunk.rstrip().endswith('.') or chunk.rstrip().endswith('\n')
-        print(f"    Chunk {i} ends properly: {ends_properly}")
+        print(f"    Chunk {i} ends properly: {_ends_properly(chunk)}")
         # Note: This is a soft check, might fail if chunks split mid-paragraph
     
     assert len(chunks) > 0, "Should produce at least one chunk"
     print("✅ Boundary detection test passed\n")
 
 
+ALL_TESTS = [
+    test_token_estimation,
+    test_chunking_small_text,
+    test_chunking_large_text,
+    test_chunking_preserves_content,
+    test_chunk_boundary_detection,
+]
+
+
 def run_all_tests():
     """Run all chunking tests"""
     print("=" * 60)
     print("OpenAI Service Chunking Tests")
     print("=" * 60 + "\n")
-    
+
     if not os.getenv('OPENAI_API_KEY'):
         print("⚠️  OPENAI_API_KEY not set - tests will be skipped")
         print("    Set the environment variable to run tests\n")
         return
-    
-    try:
-        test_token_estimation()
-        test_chunking_small_text()
-        test_chunking_large_text()
-        test_chunking_preserves_content()
-        test_chunk_boundary_detection()
-        
+
+    # The tests share no mutable state and tiktoken's Rust core releases
+    # the GIL while encoding, so run them in parallel threads
+    with ThreadPoolExecutor(max_workers=len(ALL_TESTS)) as executor:
+        futures = [executor.submit(test) for test in ALL_TESTS]
+        failures = [f.exception() for f in futures if f.exception() is not None]
+
+    if not failures:
         print("=" * 60)
         print("✅ All tests passed!")
         print("=" * 60)
-        
-    except AssertionError as e:
-        print(f"\n❌ Test failed: {e}")
-        raise
-    except Exception as e:
-        print(f"\n❌ Unexpected error: {e}")
-        raise
+        return
+
+    for error in failures:
+        if isinstance(error, AssertionError):
+            print(f"\n❌ Test failed: {error}")
+        else:
+            print(f"\n❌ Unexpected error: {error}")
+    raise failures[0]
 
 
 if __name__ == "__main__":
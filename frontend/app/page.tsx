@@ -32,9 +32,9 @@ export default function Home() {
 
       // Poll for transcription completion if needed
       let finalTranscription = transcribeResponse;
-      if (transcribeResponse.status === 'processing') {
+      if (transcribeResponse.status === 'processing' || transcribeResponse.status === 'queued') {
         // Poll every 2 seconds until complete
-        while (finalTranscription.status === 'processing') {
+        while (finalTranscription.status === 'processing' || finalTranscription.status === 'queued') {
           await new Promise(resolve => setTimeout(resolve, 2000));
           finalTranscription = await api.getTranscription(transcribeResponse.id);
         }
@@ -50,7 +50,22 @@ export default function Home() {
       // Step 2: Generate summary
       setIsSummarizing(true);
       const summaryResponse = await api.summarize(transcribeResponse.id);
-      setSummary(summaryResponse.summary);
+
+      // With a task queue the summary is generated on a worker; poll the
+      // notes endpoint until it lands, mirroring the transcription loop
+      let finalSummary = summaryResponse.summary || '';
+      if (summaryResponse.status === 'queued') {
+        while (!finalSummary) {
+          await new Promise(resolve => setTimeout(resolve, 2000));
+          const notes = await api.getNotes(transcribeResponse.id);
+          if (notes.summaryStatus === 'error') {
+            throw new Error(notes.summaryError || 'Summarization failed');
+          }
+          finalSummary = notes.summary;
+        }
+      }
+
+      setSummary(finalSummary);
       setIsSummarizing(false);
     } catch (err) {
       console.error('Processing error:', err);
@@ -15,19 +15,25 @@ const API_BASE_URL = getApiBaseUrl();
 
 export interface TranscriptionResponse {
   id: string;
-  status: 'processing' | 'completed' | 'error';
+  status: 'queued' | 'processing' | 'completed' | 'error';
   text?: string;
   error?: string;
 }
 
 export interface SummaryResponse {
-  summary: string;
+  // When the backend runs with a task queue, summarize returns
+  // { id, status: 'queued' } and the summary arrives via /api/notes/<id>
+  summary?: string;
+  id?: string;
+  status?: 'queued';
 }
 
 export interface NotesResponse {
   id: string;
   transcription: string;
   summary: string;
+  summaryStatus: '' | 'completed' | 'error';
+  summaryError?: string;
   createdAt: string;
 }
 
@@ -36,12 +42,15 @@ export const api = {
    * Upload audio file for transcription
    */
   async transcribe(audioBlob: Blob): Promise<TranscriptionResponse> {
-    const formData = new FormData();
-    formData.append('audio', audioBlob, 'recording.webm');
-
+    // Send raw bytes so the backend can stream straight to disk instead of
+    // parsing a multipart body
     const response = await fetch(`${API_BASE_URL}/api/transcribe`, {
       method: 'POST',
-      body: formData,
+      headers: {
+        'Content-Type': 'application/octet-stream',
+        'X-Filename': 'recording.webm',
+      },
+      body: audioBlob,
     });
 
     if (!response.ok) {